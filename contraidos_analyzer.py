@@ -7,13 +7,63 @@ Herramienta para análisis de archivos de contraídos con reglas de negocio espe
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterable, List, Tuple, Optional, Union
 from dataclasses import dataclass
-from datetime import datetime
-import json
+import orjson
+import logging
+import shutil
+import hashlib
+import pickle
+import os
+import tempfile
+import contextlib
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = 'calamine'
+except ImportError:  # pandas elige openpyxl/xlrd según la extensión
+    EXCEL_ENGINE = None
 
-@dataclass
+
+logger = logging.getLogger(__name__)
+
+# Subir cuando cambie la estructura de los resultados cacheados en disco
+CACHE_VERSION = 3
+
+
+def _grouped_totals(codes, importe, effective_amount, is_arqueo, is_valid_cargo,
+                    is_invalid_cargo, n_groups):
+    """Suma en una sola pasada los importes de cada grupo (código < 0 = sin grupo)"""
+    totals = np.zeros((4, n_groups))
+    has_invalid = np.zeros(n_groups, dtype=np.bool_)
+    for i in range(codes.shape[0]):
+        c = codes[i]
+        if c < 0:
+            continue
+        if is_arqueo[i]:
+            totals[0, c] += importe[i]
+        elif is_valid_cargo[i]:
+            totals[1, c] += importe[i]
+        elif is_invalid_cargo[i]:
+            totals[2, c] += importe[i]
+            has_invalid[c] = True
+        totals[3, c] += effective_amount[i]
+    return totals, has_invalid
+
+
+@lru_cache(maxsize=None)
+def _grouped_totals_jit():
+    """_grouped_totals compilado con Numba; se construye en el primer uso"""
+    from numba import njit
+    # Secuencial a propósito: en paralelo los hilos escribirían el mismo grupo a la vez
+    return njit(cache=True)(_grouped_totals)
+
+
+@dataclass(slots=True, frozen=True)
 class Operation:
     """Representa una operación individual"""
     num_operacion: int
@@ -26,7 +76,7 @@ class Operation:
     fecha: str
     tercero: str
     descripcion: str
-    estado: str
+    estado: Union[int, str]  # Entero si es numérico (normalizado al cargar)
     
     @property
     def is_arqueo(self) -> bool:
@@ -41,12 +91,12 @@ class Operation:
     @property
     def is_valid_cargo(self) -> bool:
         """Cargo válido solo si estado == 4"""
-        return self.is_cargo and (self.estado == 4 or self.estado == '4')
+        return self.is_cargo and self.estado == 4
     
     @property
     def is_invalid_cargo(self) -> bool:
         """Cargo inválido o incompleto"""
-        return self.is_cargo and self.estado != 4 and self.estado != '4'
+        return self.is_cargo and self.estado != 4
     
     @property
     def effective_amount(self) -> float:
@@ -62,204 +112,562 @@ class Operation:
 class ContraidosAnalyzer:
     """Analizador principal de archivos de contraídos"""
     
-    def __init__(self, filepath: str = None):
+    REQUIRED_COLUMNS = (
+        'Nº Operación', 'Año', 'Aplicación', 'Nº Contraido',
+        'Importe', 'CPGC', 'FASE', 'Fecha', 'Tercero',
+        'Descripción', 'Estado'
+    )
+    _REQUIRED_SET = frozenset(REQUIRED_COLUMNS)
+    
+    # Motores disponibles para la agregación por contraído
+    ENGINES = ('pandas', 'polars', 'numba', 'duckdb')
+    
+    # Paquete opcional de cada motor; solo se importa si se elige ese motor
+    _ENGINE_MODULES = {
+        'polars': ('polars', 'Polars'),
+        'numba': ('numba', 'Numba'),
+        'duckdb': ('duckdb', 'DuckDB')
+    }
+    
+    # Pasos del análisis que se guardan en la caché en disco
+    _PERSISTED_KEYS = (
+        'summary', 'by_fase', 'by_contraido', 'validation', 'calculations',
+        'rows_by_contraido', 'detail_columns'
+    )
+    
+    # Campos de Operation que forman el detalle de cada operación
+    _DETAIL_FIELDS = ('num_operacion', 'fase', 'estado', 'importe', 'fecha')
+    
+    # Tipos conocidos de antemano; las columnas enteras se dejan a la inferencia
+    # porque un valor vacío haría fallar la conversión. Los textos usan Arrow
+    # (memoria contigua) en lugar de objetos str de Python
+    COLUMN_DTYPES = {
+        'Nº Contraido': 'string[pyarrow]',
+        'Importe': 'float64',
+        'FASE': 'category',
+        'Tercero': 'string[pyarrow]',
+        'Descripción': 'string[pyarrow]',
+        'Estado': 'string[pyarrow]'
+    }
+    
+    def __init__(self, filepath: str = None, engine: str = 'pandas', cache_dir: Optional[str] = None):
+        """Crea el analizador y carga filepath si se indica
+        
+        cache_dir activa una caché en disco de los resultados. Se guarda con
+        pickle, así que el directorio debe ser de confianza: cargar un pickle
+        manipulado puede ejecutar código. Si el archivo ya está en la caché no
+        se lee el Excel: df queda en None, operations vacío y los resultados son
+        los guardados, que no dependen del motor elegido.
+        """
+        if engine not in self.ENGINES:
+            raise ValueError(f"Motor desconocido: {engine} (disponibles: {', '.join(self.ENGINES)})")
+        if engine in self._ENGINE_MODULES:
+            module, name = self._ENGINE_MODULES[engine]
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                logger.warning("%s no está instalado, se usa pandas", name)
+                engine = 'pandas'
+        
+        self.engine = engine
+        self.cache_dir = Path(cache_dir) if cache_dir else None
         self.filepath = filepath
         self.df = None
         self.operations = []
         self.analysis_results = {}
+        self._cache = {}
+        self._duckdb = None  # Conexión reutilizada entre análisis (engine='duckdb')
+        self._file_hash = None
         
         if filepath:
             self.load_file(filepath)
     
+    @classmethod
+    def analyze_many(cls, filepaths: Iterable[str], max_workers: Optional[int] = None,
+                     **kwargs) -> Dict[str, Dict]:
+        """Analiza varios archivos en paralelo, cada uno en su propio proceso
+        
+        Los procesos se crean con 'spawn' y no con fork: un hijo clonado hereda el
+        pool de hilos de Polars (o de otra librería ya usada) y puede bloquearse.
+        Cada proceso importa de nuevo el script principal al arrancar, así que la
+        llamada debe estar protegida por if __name__ == '__main__'.
+        """
+        # Lista sin repetidos: una ruta duplicada se analiza una sola vez
+        filepaths = list(dict.fromkeys(filepaths))
+        results = {}
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            analyzed = executor.map(partial(_analyze_one, **kwargs), filepaths)
+            for filepath, result in zip(filepaths, analyzed):
+                results[filepath] = result
+        return results
+    
     def load_file(self, filepath: str) -> None:
-        """Carga un archivo Excel de contraídos"""
+        """Carga un archivo Excel de contraídos (o sus resultados de la caché, ver __init__)"""
         try:
             self.filepath = filepath
-            self.df = pd.read_excel(filepath)
+            self.analysis_results = {}
+            self._cache = {}
+            self._file_hash = self._hash_file(filepath) if self.cache_dir else None
+            
+            # Un archivo idéntico ya analizado se recupera sin leer el Excel
+            cached = self._load_cached_results()
+            if cached is not None:
+                self.df = None
+                self.operations = []
+                self._cache = cached
+                logger.info("✓ Resultados recuperados de la caché: %s", Path(filepath).name)
+                logger.info("  - %d operaciones encontradas", cached['summary']['total_operations'])
+                return
+            
+            # calamine si está instalado; si no, openpyxl (pandas ya lo abre en modo
+            # solo lectura). Solo se construyen las columnas que usa el análisis
+            read = partial(
+                pd.read_excel,
+                filepath,
+                engine=EXCEL_ENGINE,
+                usecols=lambda col: str(col).strip() in self._REQUIRED_SET
+            )
+            self.df = read(dtype=self.COLUMN_DTYPES)
+            
+            # Con encabezados con espacios el esquema no se aplica al leer, y convertir
+            # después no basta: el lector ya habría pasado textos como '4.0' a número.
+            # Se vuelve a leer con los nombres reales (solo en ese caso)
+            padded = {
+                col: self.COLUMN_DTYPES[str(col).strip()] for col in self.df.columns
+                if str(col).strip() in self.COLUMN_DTYPES and col != str(col).strip()
+            }
+            if padded:
+                self.df = read(dtype={**self.COLUMN_DTYPES, **padded})
             self.df.columns = self.df.columns.str.strip()
             self._validate_columns()
             self._parse_operations()
-            print(f"✓ Archivo cargado: {Path(filepath).name}")
-            print(f"  - {len(self.df)} operaciones encontradas")
+            logger.info("✓ Archivo cargado: %s", Path(filepath).name)
+            logger.info("  - %d operaciones encontradas", len(self.df))
         except Exception as e:
             raise Exception(f"Error cargando archivo: {str(e)}")
     
     def _validate_columns(self) -> None:
         """Valida que el archivo tenga las columnas requeridas"""
-        required_columns = [
-            'Nº Operación', 'Año', 'Aplicación', 'Nº Contraido',
-            'Importe', 'CPGC', 'FASE', 'Fecha', 'Tercero',
-            'Descripción', 'Estado'
-        ]
-        missing = [col for col in required_columns if col not in self.df.columns]
-        if missing:
-            raise ValueError(f"Columnas faltantes: {missing}")
+        present = set(self.df.columns)
+        if self._REQUIRED_SET <= present:
+            return
+        missing = [col for col in self.REQUIRED_COLUMNS if col not in present]
+        raise ValueError(f"Columnas faltantes: {missing}")
     
     def _parse_operations(self) -> None:
         """Convierte el DataFrame en objetos Operation"""
-        self.operations = []
-        for _, row in self.df.iterrows():
-            # Handle Estado - convert to int if it's a numeric 4, otherwise keep as string
-            estado_val = row['Estado']
-            if pd.notna(estado_val):
-                if isinstance(estado_val, (int, float)):
-                    estado = int(estado_val)
-                else:
-                    try:
-                        estado = int(estado_val)
-                    except:
-                        estado = str(estado_val).strip()
-            else:
-                estado = ''
-            
-            op = Operation(
-                num_operacion=row['Nº Operación'],
-                año=row['Año'],
-                aplicacion=row['Aplicación'],
-                num_contraido=str(row['Nº Contraido']) if pd.notna(row['Nº Contraido']) else '',
-                importe=row['Importe'],
-                cpgc=row['CPGC'],
-                fase=row['FASE'],
-                fecha=str(row['Fecha']) if pd.notna(row['Fecha']) else '',
-                tercero=str(row['Tercero']) if pd.notna(row['Tercero']) else '',
-                descripcion=str(row['Descripción']) if pd.notna(row['Descripción']) else '',
-                estado=estado
-            )
-            self.operations.append(op)
+        df = self.df
+        
+        # Estado: entero solo si el texto es un entero (como int(str)): '4.0',
+        # '4e0' o 'inf' quedan como texto y no cuentan como estado 4
+        estado_text = self._to_text(df['Estado']).str.strip()
+        is_numeric = estado_text.str.fullmatch(r'[+-]?\d+').astype(bool)
+        estado_num = pd.to_numeric(estado_text.where(is_numeric), errors='coerce').astype('float64')
+        estado = estado_text.astype(object)
+        estado[is_numeric] = estado_text[is_numeric].map(int).astype(object)
+        num_contraido = self._to_text(df['Nº Contraido'])
+        descripcion = self._to_text(df['Descripción'])
+        fecha = self._to_text(df['Fecha'])
+        
+        # Se trabaja por columnas y se construyen los objetos en una sola pasada
+        self.operations = list(map(
+            Operation,
+            df['Nº Operación'].tolist(),
+            df['Año'].tolist(),
+            df['Aplicación'].tolist(),
+            num_contraido.tolist(),
+            df['Importe'].tolist(),
+            df['CPGC'].tolist(),
+            df['FASE'].tolist(),
+            fecha.tolist(),
+            self._to_text(df['Tercero']).tolist(),
+            descripcion.tolist(),
+            estado.tolist()
+        ))
+        
+        # Columnas de apoyo para el análisis, calculadas una sola vez
+        self._num_operacion = df['Nº Operación'].to_numpy()
+        self._num_contraido = num_contraido.to_numpy()
+        self._unique_contraidos = len(pd.unique(self._num_contraido[self._num_contraido != '']))
+        self._descripcion = descripcion
+        
+        # Fechas: 'YYYY-MM-DD 00:00:00' (celdas de fecha) o 'DD/MM/YYYY' (texto)
+        is_timestamp = fecha.str.contains('00:00:00', regex=False)
+        is_text_date = ~is_timestamp & fecha.str.contains('/', regex=False)
+        self._fechas = pd.to_datetime(
+            fecha.str.split(' ').str[0].where(is_timestamp), format='%Y-%m-%d', errors='coerce'
+        ).fillna(pd.to_datetime(fecha.where(is_text_date), format='%d/%m/%Y', errors='coerce'))
+        
+        self._compute_masks(estado_num)
+    
+    def _compute_masks(self, estado_num: pd.Series) -> None:
+        """Calcula las reglas de negocio como máscaras booleanas sobre las columnas"""
+        df = self.df
+        is_estado_4 = (estado_num == 4).to_numpy()
+        
+        # Un importe vacío cuenta como 0 en todos los motores y en los totales
+        self._importe = df['Importe'].fillna(0.0).to_numpy(dtype=np.float64)
+        
+        # FASE como categoría: las comparaciones se hacen sobre códigos enteros
+        fase = df['FASE'].astype('category')
+        fase_codes = fase.cat.codes.to_numpy()
+        self._is_arqueo = self._category_mask(fase_codes, fase.cat.categories, 'AINP')
+        self._is_cargo = self._category_mask(fase_codes, fase.cat.categories, 'M;P')
+        self._is_valid_cargo = self._is_cargo & is_estado_4
+        self._is_invalid_cargo = self._is_cargo & ~is_estado_4
+        # Cargos que anulan otra operación (la descripción menciona 'anula')
+        self._is_cancel_cargo = self._is_cargo & self._descripcion.str.contains(
+            'anula', case=False, regex=False
+        ).to_numpy(dtype=bool)
+        
+        # Importe efectivo: AINP suma, M;P válido resta, el resto no cuenta
+        self._effective_amount = np.where(
+            self._is_arqueo, self._importe, np.where(self._is_valid_cargo, -self._importe, 0.0)
+        )
+    
+    @staticmethod
+    def _category_mask(codes: np.ndarray, categories: pd.Index, value: str) -> np.ndarray:
+        """Filas cuya categoría es value, comparando el código entero"""
+        if value not in categories:
+            return np.zeros(len(codes), dtype=bool)
+        return codes == categories.get_loc(value)
+    
+    @staticmethod
+    def _to_text(series: pd.Series) -> pd.Series:
+        """Convierte una columna a texto, usando '' para valores vacíos"""
+        if isinstance(series.dtype, pd.StringDtype):
+            return series.fillna('')
+        return series.astype(object).where(series.notna(), '').astype(str)
     
     def analyze(self) -> Dict:
         """Ejecuta análisis completo del archivo"""
-        if not self.operations:
+        if not self.operations and 'summary' not in self._cache:
             raise ValueError("No hay operaciones cargadas")
         
+        is_new = 'summary' not in self._cache
+        
+        # Cada paso se calcula una sola vez y se reutiliza en los siguientes
+        by_contraido = self._memo('by_contraido', self._analyze_by_contraido)
         results = {
-            'summary': self._analyze_summary(),
-            'by_fase': self._analyze_by_fase(),
-            'by_contraido': self._analyze_by_contraido(),
-            'validation': self._validate_operations(),
-            'calculations': self._calculate_totals()
+            'summary': self._memo('summary', self._analyze_summary),
+            'by_fase': self._memo('by_fase', self._analyze_by_fase),
+            'by_contraido': by_contraido,
+            'validation': self._memo('validation', lambda: self._validate_operations(by_contraido)),
+            'calculations': self._memo('calculations', self._calculate_totals)
         }
         
+        if is_new and self.cache_dir is not None:
+            self._save_cached_results()
+        
         self.analysis_results = results
         return results
     
+    @staticmethod
+    def _hash_file(filepath: str) -> str:
+        """SHA-256 del contenido del archivo, leído por bloques"""
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def _results_cache_path(self) -> Optional[Path]:
+        """Ruta de los resultados en la caché en disco, o None si no se usa caché"""
+        if self.cache_dir is None or self._file_hash is None:
+            return None
+        return self.cache_dir / f"{self._file_hash}_v{CACHE_VERSION}.pkl"
+    
+    def _load_cached_results(self) -> Optional[Dict]:
+        """Resultados guardados de este archivo, o None si no hay caché utilizable"""
+        cache_path = self._results_cache_path()
+        if cache_path is None:
+            return None
+        try:
+            cached = pickle.loads(cache_path.read_bytes())
+            if not set(self._PERSISTED_KEYS) <= cached.keys():
+                raise ValueError("estructura inesperada")
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # Caché dañada o incompleta: se descarta y se vuelve a calcular
+            logger.warning("Caché descartada (%s): %s", e, cache_path.name)
+            with contextlib.suppress(OSError):
+                cache_path.unlink()
+            return None
+        return cached
+    
+    def _save_cached_results(self) -> None:
+        """Guarda los resultados y las columnas del detalle en la caché en disco"""
+        self._memo('detail_columns', self._detail_columns)
+        cache_path = self._results_cache_path()
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            # Se escribe en un temporal y se renombra: nunca se lee un archivo a medias
+            fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump({key: self._cache[key] for key in self._PERSISTED_KEYS}, f)
+                os.replace(tmp_path, cache_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning("No se pudo guardar la caché: %s", e)
+    
+    def _memo(self, key: str, compute):
+        """Devuelve el resultado cacheado de compute, calculándolo solo la primera vez"""
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+    
     def _analyze_summary(self) -> Dict:
         """Análisis resumen del archivo"""
         return {
             'total_operations': len(self.operations),
-            'arqueo_count': sum(1 for op in self.operations if op.is_arqueo),
-            'cargo_count': sum(1 for op in self.operations if op.is_cargo),
-            'valid_cargo_count': sum(1 for op in self.operations if op.is_valid_cargo),
-            'invalid_cargo_count': sum(1 for op in self.operations if op.is_invalid_cargo),
-            'unique_contraidos': len(set(op.num_contraido for op in self.operations if op.num_contraido)),
+            'arqueo_count': int(self._is_arqueo.sum()),
+            'cargo_count': int(self._is_cargo.sum()),
+            'valid_cargo_count': int(self._is_valid_cargo.sum()),
+            'invalid_cargo_count': int(self._is_invalid_cargo.sum()),
+            'unique_contraidos': self._unique_contraidos,
             'date_range': self._get_date_range()
         }
     
     def _get_date_range(self) -> Dict:
         """Obtiene el rango de fechas de las operaciones"""
-        valid_dates = []
-        for op in self.operations:
-            if op.fecha and op.fecha != 'nan':
-                try:
-                    # Intenta parsear diferentes formatos de fecha
-                    if '00:00:00' in op.fecha:
-                        date_str = op.fecha.split(' ')[0]
-                        date = datetime.strptime(date_str, '%Y-%m-%d')
-                    elif '/' in op.fecha:
-                        date = datetime.strptime(op.fecha, '%d/%m/%Y')
-                    else:
-                        continue
-                    valid_dates.append(date)
-                except:
-                    continue
-        
-        if valid_dates:
+        valid_dates = self._fechas.dropna()
+        
+        if len(valid_dates):
             return {
-                'earliest': min(valid_dates).strftime('%Y-%m-%d'),
-                'latest': max(valid_dates).strftime('%Y-%m-%d')
+                'earliest': valid_dates.min().strftime('%Y-%m-%d'),
+                'latest': valid_dates.max().strftime('%Y-%m-%d')
             }
         return {'earliest': None, 'latest': None}
     
     def _analyze_by_fase(self) -> Dict:
         """Análisis agrupado por fase"""
-        ainp_ops = [op for op in self.operations if op.is_arqueo]
-        mp_ops = [op for op in self.operations if op.is_cargo]
+        ainp = self._is_arqueo
+        valid = self._is_valid_cargo
+        invalid = self._is_invalid_cargo
         
         return {
             'AINP': {
-                'count': len(ainp_ops),
-                'total_amount': sum(op.importe for op in ainp_ops),
-                'operations': [op.num_operacion for op in ainp_ops]
+                'count': int(ainp.sum()),
+                'total_amount': float(self._importe[ainp].sum()),
+                'operations': self._num_operacion[ainp].tolist()
             },
             'M;P': {
-                'count': len(mp_ops),
+                'count': int(self._is_cargo.sum()),
                 'valid': {
-                    'count': sum(1 for op in mp_ops if op.is_valid_cargo),
-                    'total_amount': sum(op.importe for op in mp_ops if op.is_valid_cargo),
-                    'operations': [op.num_operacion for op in mp_ops if op.is_valid_cargo]
+                    'count': int(valid.sum()),
+                    'total_amount': float(self._importe[valid].sum()),
+                    'operations': self._num_operacion[valid].tolist()
                 },
                 'invalid': {
-                    'count': sum(1 for op in mp_ops if op.is_invalid_cargo),
-                    'total_amount': sum(op.importe for op in mp_ops if op.is_invalid_cargo),
-                    'operations': [op.num_operacion for op in mp_ops if op.is_invalid_cargo]
+                    'count': int(invalid.sum()),
+                    'total_amount': float(self._importe[invalid].sum()),
+                    'operations': self._num_operacion[invalid].tolist()
                 }
             }
         }
     
     def _analyze_by_contraido(self) -> List[Dict]:
         """Análisis agrupado por número de contraído"""
-        contraido_groups = {}
-        
-        for op in self.operations:
-            if not op.num_contraido:
-                continue
-            
-            if op.num_contraido not in contraido_groups:
-                contraido_groups[op.num_contraido] = {
-                    'num_contraido': op.num_contraido,
-                    'operations': [],
-                    'total_arqueo': 0,
-                    'total_cargo_valid': 0,
-                    'total_cargo_invalid': 0,
-                    'net_balance': 0,
-                    'has_invalid_operations': False,
-                    'needs_attention': False
-                }
-            
-            group = contraido_groups[op.num_contraido]
-            group['operations'].append({
-                'num_operacion': op.num_operacion,
-                'fase': op.fase,
-                'estado': op.estado,
-                'importe': op.importe,
-                'fecha': op.fecha,
-                'descripcion': op.descripcion[:50] + '...' if len(op.descripcion) > 50 else op.descripcion
+        if self.engine == 'polars':
+            totals, rows_by_contraido = self._contraido_totals_polars()
+        elif self.engine == 'numba':
+            totals, rows_by_contraido = self._contraido_totals_numba()
+        elif self.engine == 'duckdb':
+            totals, rows_by_contraido = self._contraido_totals_duckdb()
+        else:
+            totals, rows_by_contraido = self._contraido_totals_pandas()
+        
+        # Ordenar por balance neto (orden estable, como sort de Python)
+        order = np.argsort(-totals['net_balance'].abs().to_numpy(), kind='stable')
+        totals = totals.iloc[order]
+        
+        result = []
+        for num_contraido, total_arqueo, total_valid, total_invalid, net_balance, has_invalid in zip(
+            totals.index.tolist(),
+            totals['total_arqueo'].tolist(),
+            totals['total_cargo_valid'].tolist(),
+            totals['total_cargo_invalid'].tolist(),
+            totals['net_balance'].tolist(),
+            totals['has_invalid_operations'].tolist()
+        ):
+            result.append({
+                'num_contraido': num_contraido,
+                'num_operations': len(rows_by_contraido[num_contraido]),
+                'total_arqueo': total_arqueo,
+                'total_cargo_valid': total_valid,
+                'total_cargo_invalid': total_invalid,
+                'net_balance': net_balance,
+                'has_invalid_operations': has_invalid,
+                'needs_attention': has_invalid
             })
-            
-            if op.is_arqueo:
-                group['total_arqueo'] += op.importe
-            elif op.is_valid_cargo:
-                group['total_cargo_valid'] += op.importe
-            elif op.is_invalid_cargo:
-                group['total_cargo_invalid'] += op.importe
-                group['has_invalid_operations'] = True
-                group['needs_attention'] = True
-            
-            group['net_balance'] = group['total_arqueo'] - group['total_cargo_valid']
-        
-        # Convertir a lista y ordenar por balance neto
-        result = list(contraido_groups.values())
-        result.sort(key=lambda x: abs(x['net_balance']), reverse=True)
         
+        # El detalle por operación se construye solo cuando se pide
+        self._cache['rows_by_contraido'] = rows_by_contraido
         return result
     
-    def _validate_operations(self) -> Dict:
+    def get_group_operations(self, num_contraido: str) -> List[Dict]:
+        """Detalle de las operaciones de un contraído, construido bajo demanda"""
+        self._memo('by_contraido', self._analyze_by_contraido)
+        rows = self._cache['rows_by_contraido'].get(num_contraido)
+        if rows is None:
+            return []
+        
+        columns = self._memo('detail_columns', self._detail_columns)
+        fields = tuple(columns)
+        return [
+            dict(zip(fields, values))
+            for values in zip(*(columns[field][rows] for field in fields))
+        ]
+    
+    def _detail_columns(self) -> Dict[str, np.ndarray]:
+        """Campos del detalle por operación como columnas indexables por fila"""
+        columns = {
+            field: np.array([getattr(op, field) for op in self.operations], dtype=object)
+            for field in self._DETAIL_FIELDS
+        }
+        columns['descripcion'] = self._truncate_descriptions()
+        return columns
+    
+    def _truncate_descriptions(self) -> np.ndarray:
+        """Descripciones recortadas a 50 caracteres para el detalle por operación"""
+        descripcion = self._descripcion
+        return descripcion.str.slice(0, 50).where(
+            descripcion.str.len() <= 50, descripcion.str.slice(0, 50) + '...'
+        ).to_numpy()
+    
+    def _contraido_totals_pandas(self) -> Tuple[pd.DataFrame, Dict]:
+        """Totales por contraído calculados con groupby de pandas"""
+        importe = self._importe
+        frame = pd.DataFrame({
+            'total_arqueo': np.where(self._is_arqueo, importe, 0.0),
+            'total_cargo_valid': np.where(self._is_valid_cargo, importe, 0.0),
+            'total_cargo_invalid': np.where(self._is_invalid_cargo, importe, 0.0),
+            'net_balance': self._effective_amount,
+            'has_invalid_operations': self._is_invalid_cargo
+        })
+        
+        # Las operaciones sin contraído quedan fuera de la agrupación
+        contraido = pd.Series(self._num_contraido)
+        grouped = frame.groupby(contraido.where(contraido != ''), sort=False)
+        totals = grouped.agg({
+            'total_arqueo': 'sum',
+            'total_cargo_valid': 'sum',
+            'total_cargo_invalid': 'sum',
+            'net_balance': 'sum',
+            'has_invalid_operations': 'any'
+        })
+        return totals, grouped.indices
+    
+    def _contraido_totals_polars(self) -> Tuple[pd.DataFrame, Dict]:
+        """Totales por contraído calculados con Polars"""
+        import polars as pl
+        
+        importe = pl.col('importe')
+        grouped = (
+            pl.DataFrame({
+                'num_contraido': pl.Series(self._num_contraido, dtype=pl.String),
+                'importe': self._importe,
+                'effective_amount': self._effective_amount,
+                'is_arqueo': self._is_arqueo,
+                'is_valid_cargo': self._is_valid_cargo,
+                'is_invalid_cargo': self._is_invalid_cargo
+            })
+            .lazy()
+            .with_row_index('row')
+            .filter(pl.col('num_contraido') != '')
+            .group_by('num_contraido', maintain_order=True)
+            .agg(
+                total_arqueo=importe.filter(pl.col('is_arqueo')).sum(),
+                total_cargo_valid=importe.filter(pl.col('is_valid_cargo')).sum(),
+                total_cargo_invalid=importe.filter(pl.col('is_invalid_cargo')).sum(),
+                net_balance=pl.col('effective_amount').sum(),
+                has_invalid_operations=pl.col('is_invalid_cargo').any(),
+                rows=pl.col('row')
+            )
+            .collect()
+        )
+        
+        num_contraidos = grouped['num_contraido'].to_list()
+        totals = pd.DataFrame({
+            col: grouped[col].to_numpy()
+            for col in ('total_arqueo', 'total_cargo_valid', 'total_cargo_invalid',
+                        'net_balance', 'has_invalid_operations')
+        }, index=num_contraidos)
+        return totals, dict(zip(num_contraidos, grouped['rows'].to_list()))
+    
+    def _contraido_totals_numba(self) -> Tuple[pd.DataFrame, Dict]:
+        """Totales por contraído calculados con un kernel compilado con Numba"""
+        contraido = pd.Series(self._num_contraido)
+        codes, num_contraidos = pd.factorize(contraido.where(contraido != ''))
+        n_groups = len(num_contraidos)
+        sums, has_invalid = _grouped_totals_jit()(
+            codes, self._importe, self._effective_amount, self._is_arqueo,
+            self._is_valid_cargo, self._is_invalid_cargo, n_groups
+        )
+        totals = pd.DataFrame({
+            'total_arqueo': sums[0],
+            'total_cargo_valid': sums[1],
+            'total_cargo_invalid': sums[2],
+            'net_balance': sums[3],
+            'has_invalid_operations': has_invalid
+        }, index=num_contraidos.tolist())
+        
+        # Filas de cada grupo: ordenar por código y cortar por tamaños de grupo
+        sorted_rows = np.argsort(codes, kind='stable')[np.count_nonzero(codes < 0):]
+        sizes = np.bincount(codes[codes >= 0], minlength=n_groups)
+        rows = np.split(sorted_rows, np.cumsum(sizes)[:-1])
+        return totals, dict(zip(num_contraidos.tolist(), rows))
+    
+    def _contraido_totals_duckdb(self) -> Tuple[pd.DataFrame, Dict]:
+        """Totales por contraído calculados con una consulta DuckDB"""
+        if self._duckdb is None:
+            import duckdb
+            self._duckdb = duckdb.connect()
+        
+        self._duckdb.register('operaciones', pd.DataFrame({
+            'fila': np.arange(len(self._importe)),
+            'num_contraido': self._num_contraido,
+            'importe': self._importe,
+            'effective_amount': self._effective_amount,
+            'is_arqueo': self._is_arqueo,
+            'is_valid_cargo': self._is_valid_cargo,
+            'is_invalid_cargo': self._is_invalid_cargo
+        }))
+        try:
+            grouped = self._duckdb.execute("""
+                SELECT
+                    num_contraido,
+                    SUM(CASE WHEN is_arqueo THEN importe ELSE 0 END) AS total_arqueo,
+                    SUM(CASE WHEN is_valid_cargo THEN importe ELSE 0 END) AS total_cargo_valid,
+                    SUM(CASE WHEN is_invalid_cargo THEN importe ELSE 0 END) AS total_cargo_invalid,
+                    SUM(effective_amount) AS net_balance,
+                    BOOL_OR(is_invalid_cargo) AS has_invalid_operations,
+                    LIST(fila ORDER BY fila) AS filas
+                FROM operaciones
+                WHERE num_contraido <> ''
+                GROUP BY num_contraido
+                ORDER BY MIN(fila)
+            """).df()
+        finally:
+            self._duckdb.unregister('operaciones')
+        
+        num_contraidos = grouped['num_contraido'].tolist()
+        totals = grouped.drop(columns=['num_contraido', 'filas'])
+        totals.index = num_contraidos
+        return totals, dict(zip(num_contraidos, grouped['filas'].tolist()))
+    
+    def _validate_operations(self, by_contraido: Optional[List[Dict]] = None) -> Dict:
         """Validación de operaciones según reglas de negocio"""
         issues = []
         warnings = []
         
         # Buscar operaciones M;P sin estado 4
-        invalid_mp = [op for op in self.operations if op.is_invalid_cargo]
+        invalid_mp = [self.operations[i] for i in np.flatnonzero(self._is_invalid_cargo)]
         if invalid_mp:
             for op in invalid_mp:
                 issues.append({
@@ -272,7 +680,8 @@ class ContraidosAnalyzer:
                 })
         
         # Buscar contraídos con balance significativo
-        by_contraido = self._analyze_by_contraido()
+        if by_contraido is None:
+            by_contraido = self._memo('by_contraido', self._analyze_by_contraido)
         for group in by_contraido:
             if abs(group['net_balance']) > 0.01:  # Tolerancia para redondeo
                 if group['net_balance'] > 0:
@@ -291,19 +700,23 @@ class ContraidosAnalyzer:
                     })
         
         # Verificar si hay operaciones M;P sin anulación
+        # Índice de anulaciones: contraído -> operaciones M;P que mencionan 'anula'
+        is_cancel = self._is_cancel_cargo
+        cancel_ops = {}
+        for num_contraido, num_operacion in zip(
+            self._num_contraido[is_cancel].tolist(), self._num_operacion[is_cancel].tolist()
+        ):
+            cancel_ops.setdefault(num_contraido, set()).add(num_operacion)
+        
         mp_without_cancel = []
-        for op in self.operations:
-            if op.is_invalid_cargo:
-                # Buscar si hay otra operación M;P que anule esta
-                has_cancellation = any(
-                    other.is_cargo and 
-                    other.num_contraido == op.num_contraido and
-                    other.num_operacion != op.num_operacion and
-                    'anula' in other.descripcion.lower()
-                    for other in self.operations
-                )
-                if not has_cancellation:
-                    mp_without_cancel.append(op)
+        for op in invalid_mp:
+            # Buscar si hay otra operación M;P que anule esta
+            has_cancellation = any(
+                num_operacion != op.num_operacion
+                for num_operacion in cancel_ops.get(op.num_contraido, ())
+            )
+            if not has_cancellation:
+                mp_without_cancel.append(op)
         
         if mp_without_cancel:
             for op in mp_without_cancel:
@@ -325,15 +738,15 @@ class ContraidosAnalyzer:
     
     def _calculate_totals(self) -> Dict:
         """Calcula los totales según las reglas de negocio"""
-        total_arqueo = sum(op.importe for op in self.operations if op.is_arqueo)
-        total_cargo_valid = sum(op.importe for op in self.operations if op.is_valid_cargo)
-        total_cargo_invalid = sum(op.importe for op in self.operations if op.is_invalid_cargo)
+        total_arqueo = float(self._importe[self._is_arqueo].sum())
+        total_cargo_valid = float(self._importe[self._is_valid_cargo].sum())
+        total_cargo_invalid = float(self._importe[self._is_invalid_cargo].sum())
         
         return {
             'total_arqueo_positive': total_arqueo,
             'total_cargo_negative': total_cargo_valid,
             'total_cargo_invalid': total_cargo_invalid,
-            'net_balance': total_arqueo - total_cargo_valid,
+            'net_balance': float(self._effective_amount.sum()),
             'percentage_invalid': (total_cargo_invalid / (total_cargo_valid + total_cargo_invalid) * 100) 
                                  if (total_cargo_valid + total_cargo_invalid) > 0 else 0
         }
@@ -347,8 +760,23 @@ class ContraidosAnalyzer:
             base_name = Path(self.filepath).stem if self.filepath else 'contraidos'
             output_path = f"{base_name}_analysis.json"
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(self.analysis_results, f, indent=2, ensure_ascii=False, default=str)
+        # El JSON incluye el detalle por operación de cada contraído
+        results = dict(self.analysis_results)
+        results['by_contraido'] = [
+            {
+                'num_contraido': group['num_contraido'],
+                'operations': self.get_group_operations(group['num_contraido']),
+                **group
+            }
+            for group in results['by_contraido']
+        ]
+        
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(
+                results,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+                default=str
+            ))
         
         return output_path
     
@@ -408,7 +836,7 @@ class ContraidosAnalyzer:
             for contraido in problematic[:10]:
                 report.append(f"\n  Contraído: {contraido['num_contraido']}")
                 report.append(f"    • Balance: €{contraido['net_balance']:,.2f}")
-                report.append(f"    • Operaciones: {len(contraido['operations'])}")
+                report.append(f"    • Operaciones: {contraido['num_operations']}")
                 if contraido['has_invalid_operations']:
                     report.append(f"    • ⚠️ Tiene operaciones inválidas")
         
@@ -416,7 +844,7 @@ class ContraidosAnalyzer:
         
         return "\n".join(report)
     
-    def export_to_excel(self, output_path: str = None) -> str:
+    def export_to_excel(self, output_path: str = None, include_raw: bool = False) -> str:
         """Exporta el análisis a un archivo Excel con múltiples hojas"""
         if not self.analysis_results:
             self.analyze()
@@ -425,11 +853,17 @@ class ContraidosAnalyzer:
             base_name = Path(self.filepath).stem if self.filepath else 'contraidos'
             output_path = f"{base_name}_analysis.xlsx"
         
-        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-            # Hoja 1: Datos originales
-            self.df.to_excel(writer, sheet_name='Datos_Originales', index=False)
-            
-            # Hoja 2: Resumen
+        # Los datos originales no se reescriben como hoja: se copia el archivo
+        if include_raw:
+            if not self.filepath:
+                raise ValueError("No hay archivo original que copiar")
+            source = Path(self.filepath)
+            raw_path = Path(output_path).with_name(f"{Path(output_path).stem}_raw{source.suffix}")
+            shutil.copyfile(source, raw_path)
+            logger.info("  - Datos originales: %s", raw_path)
+        
+        with pd.ExcelWriter(output_path, engine='xlsxwriter') as writer:
+            # Hoja 1: Resumen
             summary_data = {
                 'Métrica': [
                     'Total Operaciones',
@@ -452,7 +886,7 @@ class ContraidosAnalyzer:
             }
             pd.DataFrame(summary_data).to_excel(writer, sheet_name='Resumen', index=False)
             
-            # Hoja 3: Análisis por Contraído
+            # Hoja 2: Análisis por Contraído
             contraido_data = []
             for group in self.analysis_results['by_contraido']:
                 contraido_data.append({
@@ -461,12 +895,12 @@ class ContraidosAnalyzer:
                     'Total Cargo Válido': group['total_cargo_valid'],
                     'Total Cargo Inválido': group['total_cargo_invalid'],
                     'Balance Neto': group['net_balance'],
-                    'Nº Operaciones': len(group['operations']),
+                    'Nº Operaciones': group['num_operations'],
                     'Requiere Atención': 'Sí' if group['needs_attention'] else 'No'
                 })
             pd.DataFrame(contraido_data).to_excel(writer, sheet_name='Por_Contraido', index=False)
             
-            # Hoja 4: Problemas detectados
+            # Hoja 3: Problemas detectados
             issues_data = []
             for issue in self.analysis_results['validation']['issues']:
                 issues_data.append({
@@ -481,10 +915,17 @@ class ContraidosAnalyzer:
         return output_path
 
 
+def _analyze_one(filepath: str, **kwargs) -> Dict:
+    """Analiza un archivo en un proceso de trabajo (usado por analyze_many)"""
+    return ContraidosAnalyzer(filepath, **kwargs).analyze()
+
+
 def main():
     """Función principal para uso desde línea de comandos"""
     import sys
     
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    
     if len(sys.argv) < 2:
         print("Uso: python contraidos_analyzer.py <archivo.xlsx>")
         sys.exit(1)
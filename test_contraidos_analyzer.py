@@ -0,0 +1,163 @@
+"""
+Pruebas de equivalencia del analizador de contraídos
+Los libros Excel se generan en cada ejecución con los casos límite conocidos
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from contraidos_analyzer import ContraidosAnalyzer
+
+
+# Importes con fracciones binarias exactas: las sumas no dependen del orden
+ROWS = [
+    # Nº Operación, Nº Contraido, Importe, FASE, Estado, Descripción
+    (1, 'A', 100.0, 'AINP', 4, 'Arqueo'),
+    (2, 'A', None, 'AINP', 4, 'Arqueo sin importe'),
+    (3, 'A', 40.0, 'M;P', 4, 'Cargo válido'),
+    (4, 'A', 25.5, 'M;P', None, 'Cargo sin estado'),
+    (5, 'B', 60.0, 'AINP', 4, 'Arqueo'),
+    (6, 'B', 10.0, 'M;P', 3, 'Anula la propia operación'),
+    (7, 'C', 30.0, 'M;P', 2, 'Cargo cancelado'),
+    (8, 'C', 30.0, 'M;P', 4, 'anula la operación 7'),
+    (9, None, 50.0, 'AINP', 4, 'Arqueo sin contraído'),
+    (10, None, 5.0, 'M;P', ' 4 ', None),
+    (11, 'E', 7.25, 'M;P', '4.0', 'Estado con decimales'),
+]
+
+
+def _write_workbook(path, padding=''):
+    """Genera el libro de prueba, con espacios opcionales en los encabezados"""
+    num_operacion, num_contraido, importe, fase, estado, descripcion = zip(*ROWS)
+    df = pd.DataFrame({
+        'Nº Operación': num_operacion,
+        'Año': 2024,
+        'Aplicación': 1,
+        'Nº Contraido': num_contraido,
+        'Importe': np.array(importe, dtype=float),
+        'CPGC': 1,
+        'FASE': fase,
+        'Fecha': '15/03/2024',
+        'Tercero': 'Tercero',
+        'Descripción': descripcion,
+        'Estado': estado
+    })
+    df.columns = [f"{padding}{col}{padding}" for col in df.columns]
+    df.to_excel(path, index=False)
+    return str(path)
+
+
+@pytest.fixture(scope='module')
+def workbook(tmp_path_factory):
+    """Libro con encabezados rodeados de espacios"""
+    return _write_workbook(tmp_path_factory.mktemp('libros') / 'contraidos.xlsx', padding=' ')
+
+
+@pytest.fixture(scope='module')
+def plain_workbook(tmp_path_factory):
+    """El mismo libro con los encabezados exactos"""
+    return _write_workbook(tmp_path_factory.mktemp('libros') / 'contraidos_plain.xlsx')
+
+
+@pytest.fixture(scope='module')
+def reference(workbook):
+    """Resultados del motor pandas, usados como referencia"""
+    return ContraidosAnalyzer(workbook).analyze()
+
+
+def _analyzer(workbook, engine, **kwargs):
+    """Analizador con el motor pedido, o skip si su librería no está instalada"""
+    analyzer = ContraidosAnalyzer(workbook, engine=engine, **kwargs)
+    if analyzer.engine != engine:
+        pytest.skip(f"{engine} no está instalado")
+    return analyzer
+
+
+def test_business_rules(reference):
+    """Importe vacío, estados no enteros, filas sin contraído y anulaciones"""
+    summary = reference['summary']
+    assert summary['total_operations'] == len(ROWS)
+    assert summary['valid_cargo_count'] == 3
+    assert summary['invalid_cargo_count'] == 4
+    assert summary['unique_contraidos'] == 4
+    
+    groups = {group['num_contraido']: group for group in reference['by_contraido']}
+    assert [group['num_contraido'] for group in reference['by_contraido']] == ['A', 'B', 'C', 'E']
+    assert groups['A']['total_arqueo'] == 100.0
+    assert groups['A']['net_balance'] == 60.0
+    assert groups['C']['net_balance'] == -30.0
+    assert groups['E']['total_cargo_invalid'] == 7.25
+    
+    calcs = reference['calculations']
+    assert calcs['total_arqueo_positive'] == 210.0
+    assert calcs['total_cargo_negative'] == 75.0
+    assert calcs['total_cargo_invalid'] == 72.75
+    assert calcs['net_balance'] == 135.0
+    
+    issues = reference['validation']['issues']
+    assert [i['operation'] for i in issues if i['type'] == 'INVALID_CARGO'] == [4, 6, 7, 11]
+    assert [i['operation'] for i in issues if i['type'] == 'MP_WITHOUT_CANCELLATION'] == [4, 6, 11]
+
+
+def test_padded_headers(workbook, plain_workbook, reference):
+    """Los encabezados con espacios reciben los mismos tipos y resultados"""
+    padded = ContraidosAnalyzer(workbook)
+    plain = ContraidosAnalyzer(plain_workbook)
+    assert padded.df.dtypes.to_dict() == plain.df.dtypes.to_dict()
+    assert plain.analyze() == reference
+
+
+@pytest.mark.parametrize('engine', ContraidosAnalyzer.ENGINES)
+def test_engines_match_pandas(workbook, reference, engine):
+    """Todos los motores dan el mismo análisis y el mismo detalle por operación"""
+    analyzer = _analyzer(workbook, engine)
+    assert analyzer.analyze() == reference
+    
+    expected = ContraidosAnalyzer(workbook)
+    for group in reference['by_contraido']:
+        _assert_same_details(
+            analyzer.get_group_operations(group['num_contraido']),
+            expected.get_group_operations(group['num_contraido'])
+        )
+
+
+@pytest.mark.parametrize('engine', ContraidosAnalyzer.ENGINES)
+def test_cache_round_trip(workbook, reference, engine, tmp_path):
+    """Un segundo análisis sale de la caché sin leer el Excel y con el mismo resultado"""
+    first = _analyzer(workbook, engine, cache_dir=tmp_path)
+    first.analyze()
+    first_json = first.export_analysis(str(tmp_path / 'primero.json'))
+    
+    second = _analyzer(workbook, engine, cache_dir=tmp_path)
+    assert second.df is None
+    assert second.analyze() == reference
+    second_json = second.export_analysis(str(tmp_path / 'segundo.json'))
+    with open(first_json, 'rb') as a, open(second_json, 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_corrupt_cache_is_discarded(workbook, reference, tmp_path):
+    """Una caché truncada se descarta y se vuelve a generar"""
+    ContraidosAnalyzer(workbook, cache_dir=tmp_path).analyze()
+    cache_file, = tmp_path.glob('*.pkl')
+    cache_file.write_bytes(cache_file.read_bytes()[:20])
+    
+    analyzer = ContraidosAnalyzer(workbook, cache_dir=tmp_path)
+    assert analyzer.df is not None
+    assert analyzer.analyze() == reference
+    assert ContraidosAnalyzer(workbook, cache_dir=tmp_path).df is None
+
+
+def _assert_same_details(actual, expected):
+    """Compara el detalle por operación tratando NaN == NaN (importe vacío)"""
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        assert got.keys() == want.keys()
+        for key in want:
+            if isinstance(want[key], float) and math.isnan(want[key]):
+                assert math.isnan(got[key])
+            else:
+                assert got[key] == want[key]